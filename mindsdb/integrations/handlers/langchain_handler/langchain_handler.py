@@ -1,6 +1,15 @@
 import re
 import os
-from typing import Optional, Dict
+import json
+import string
+import hashlib
+import queue
+import threading
+import functools
+import collections
+import contextvars
+import concurrent.futures
+from typing import Optional, Dict, List
 
 import numpy as np
 import pandas as pd
@@ -8,13 +17,16 @@ import pandas as pd
 from langchain.llms import OpenAI
 from langchain.chat_models import ChatOpenAI  # GPT-4 fails to follow the output langchain requires, avoid using for now
 from langchain.agents import initialize_agent, load_tools, Tool, create_sql_agent
-from langchain.prompts import PromptTemplate
+from langchain.embeddings import OpenAIEmbeddings
 from langchain.utilities import GoogleSerperAPIWrapper
 from langchain.agents.agent_toolkits import SQLDatabaseToolkit
 from langchain.chains.conversation.memory import ConversationSummaryBufferMemory
 
+from mindsdb.interfaces.storage import db
 from mindsdb.integrations.handlers.openai_handler.openai_handler import OpenAIHandler, CHAT_MODELS
 from mindsdb.integrations.handlers.langchain_handler.mindsdb_database_agent import MindsDBSQL
+from mindsdb.integrations.handlers.langchain_handler.semantic_cache import SemanticCache
+from mindsdb.utilities import log
 from mindsdb_sql import parse_sql, Insert
 
 
@@ -22,6 +34,84 @@ _DEFAULT_MODEL = 'gpt-3.5-turbo'  # TODO: enable other LLM backends (AI21, Anthr
 _DEFAULT_MAX_TOKENS = 2048  # requires more than vanilla OpenAI due to ongoing summarization and 3rd party input
 _DEFAULT_AGENT_MODEL = 'zero-shot-react-description'
 _DEFAULT_AGENT_TOOLS = ['python_repl', 'wikipedia']  # these require no additional arguments
+_DEFAULT_MAX_CONCURRENCY = 8  # max amount of prompts that are sent to the agent at the same time
+_DEFAULT_CACHE_MAX_SIZE = 1024
+_CACHE_SETTINGS = (  # completions are only reused between predict calls that agree on all of these
+    'modal_dispatch', 'model_name', 'agent_name', 'temperature', 'max_tokens', 'top_p', 'frequency_penalty',
+    'presence_penalty', 'n', 'best_of', 'logit_bias', 'tools', 'max_iterations',
+)
+_AGENT_ERROR_PREFIX = 'agent failed with error'
+_AGENT_STOPPED_OUTPUT = 'Agent stopped due to iteration limit or time limit.'  # returned by langchain on early stop
+_STATELESS_TOOLS = ('wikipedia',)  # safe to share across models, users and threads
+_TEMPLATE_RE = re.compile(r"\{\{(.*?)\}\}")
+
+_MDB_TOOL_DESCRIPTION = "useful to read from databases or tables connected to the mindsdb machine learning package. the action must be a valid simple SQL query, always ending with a semicolon. For example, you can do `show databases;` to list the available data sources, and `show tables;` to list the available tables within each data source."  # noqa
+_MDB_META_TOOL_DESCRIPTION = "useful to get column names from a mindsdb table or metadata from a mindsdb data source. the command should be either 1) a data source name, to list all available tables that it exposes, or 2) a string with the format `data_source_name.table_name` (for example, `files.my_table`), to get the table name, table type, column names, data types per column, and amount of rows of the specified table."  # noqa
+_MDB_WRITE_TOOL_DESCRIPTION = "useful to write into data sources connected to mindsdb. command must be a valid SQL query with syntax: `INSERT INTO data_source_name.table_name (column_name_1, column_name_2, [...]) VALUES (column_1_value_row_1, column_2_value_row_1, [...]), (column_1_value_row_2, column_2_value_row_2, [...]), [...];`. note the command always ends with a semicolon. order of column names and values for each row must be a perfect match. If write fails, try casting value with a function, passing the value without quotes, or truncating string as needed.`."  # noqa
+
+
+@functools.lru_cache(maxsize=None)
+def _load_stateless_tool(name: str) -> tuple:
+    """ These are expensive to set up (e.g. the wikipedia client) but hold no state, so they are loaded only once. """
+    return tuple(load_tools([name]))
+
+
+def _load_tools(toolkit: List[str]) -> list:
+    """
+    Tools that keep state between runs (e.g. `python_repl` globals) are always loaded fresh, as before. Note that
+    `load_tools` may return more tools than names (e.g. `requests_all`), so its output is used as is.
+    """
+    tools = load_tools([name for name in toolkit if name not in _STATELESS_TOOLS])
+    for name in toolkit:
+        if name in _STATELESS_TOOLS:
+            tools.extend(_load_stateless_tool(name))
+    return tools
+
+
+def _format_agent_error(e: Exception) -> str:
+    """ Agent errors may carry huge payloads (e.g. prompts or traces), so only the start of the message is kept. """
+    message = e.args[0] if e.args and isinstance(e.args[0], str) else type(e).__name__
+    return f'{_AGENT_ERROR_PREFIX}:\n{message[:50]}...'
+
+
+def _compile_template(template: str, variables: List[str]):
+    """
+    Generates a formatter equivalent to `template.format_map`, specialized for `template` so that it is not parsed
+    again for each record. Records are tuples holding the value of each of `variables`, in order. User-provided text
+    never reaches the generated source, as literals and variable positions are only referenced through generated
+    identifiers.
+    """
+    def _fallback(r):
+        return template.format_map(dict(zip(variables, r)))
+
+    positions = {variable: i for i, variable in enumerate(variables)}
+    namespace, body = {}, []
+    try:
+        for i, (literal, field, spec, conversion) in enumerate(string.Formatter().parse(template)):
+            if spec or conversion or (field is not None and field not in positions):
+                return _fallback  # rarely used in prompts, not worth specializing
+            if literal:
+                namespace[f'_l{i}'] = literal
+                body.append(f'{{_l{i}}}')
+            if field is not None:
+                namespace[f'_k{i}'] = positions[field]
+                body.append(f'{{r[_k{i}]}}')
+    except ValueError:
+        return _fallback  # malformed template, let `format_map` raise the usual error when used
+
+    exec(f"def _formatter(r):\n    return f'{''.join(body)}'\n", namespace)
+    return namespace['_formatter']
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_template(base_template: str):
+    """
+    Returns the input variables of a `{{var}}`-style template, along with a compiled formatter for it. Memoized at
+    module level, as handlers are rebuilt for every predict call.
+    """
+    input_variables = tuple(dict.fromkeys(_TEMPLATE_RE.findall(base_template)))  # unique, in order
+    formatter = _compile_template(base_template.replace('{{', '{').replace('}}', '}'), list(input_variables))
+    return input_variables, formatter
 
 
 class LangChainHandler(OpenAIHandler):
@@ -51,6 +141,8 @@ class LangChainHandler(OpenAIHandler):
         self.default_agent_model = _DEFAULT_AGENT_MODEL
         self.default_agent_tools = _DEFAULT_AGENT_TOOLS
         self.write_privileges = False  # if True, this agent is able to write into other active mindsdb integrations
+        self._metadata_cache = {}  # metadata lookup key -> value, used by the MindsDB metadata tool
+        self._metadata_lock = threading.Lock()
 
     def _get_serper_api_key(self, args, strict=True):
         if 'serper_api_key' in args:
@@ -108,40 +200,29 @@ class LangChainHandler(OpenAIHandler):
         }
 
         agent_creation_method = modal_dispatch.get(args.get('modal_dispatch', 'default'), 'default_completion')
-        agent = getattr(self, agent_creation_method)(df, args, pred_args)
-        return self.run_agent(df, agent, args, pred_args)
+        agent_factory = functools.partial(getattr(self, agent_creation_method), df, args, pred_args)
+        agent = agent_factory()
+        if agent_creation_method != 'default_completion':
+            # the sql agent switches the current database of the shared executor, so its prompts run sequentially
+            return self.run_agent(df, agent, args, pred_args)
+
+        self._publish_description(agent, args, pred_args)  # only once, not for every agent built by the workers
+        return self.run_agent(df, agent, args, pred_args, agent_factory=agent_factory)
 
     def default_completion(self, df, args=None, pred_args=None):
         """
         Mostly follows the logic of the OpenAI handler, but with a few additions:
             - setup the langchain toolkit
             - setup the langchain agent (memory included)
-            - setup information to be published when describing the model
 
-        Ref link from the LangChain documentation on how to accomplish the first two items:
+        Ref link from the LangChain documentation on how to accomplish both items:
             - python.langchain.com/en/latest/modules/agents/agents/custom_agent.html
+
+        Information to be published when describing the model is set up separately, in `_publish_description`.
         """
         pred_args = pred_args if pred_args else {}
-
-        # api argument validation
-        model_name = pred_args.get('model_name', args.get('model_name', self.default_model))
         agent_name = pred_args.get('agent_name', args.get('agent_name', self.default_agent_model))
-
-        model_kwargs = {
-            'model_name': model_name,
-            'temperature': min(1.0, max(0.0, pred_args.get('temperature', args.get('temperature', 0.0)))),
-            'max_tokens': pred_args.get('max_tokens', args.get('max_tokens', self.default_max_tokens)),
-            'top_p': pred_args.get('top_p', None),
-            'frequency_penalty': pred_args.get('frequency_penalty', None),
-            'presence_penalty': pred_args.get('presence_penalty', None),
-            'n': pred_args.get('n', None),
-            'best_of': pred_args.get('best_of', None),
-            'request_timeout': pred_args.get('request_timeout', None),
-            'logit_bias': pred_args.get('logit_bias', None),
-            'openai_api_key': self._get_openai_api_key(args, strict=True),
-            'serper_api_key': self._get_serper_api_key(args, strict=False),
-        }
-        model_kwargs = {k: v for k, v in model_kwargs.items() if v is not None}  # filter out None values
+        model_kwargs = self._get_model_kwargs(args, pred_args)
 
         # langchain tool setup
         pred_args['tools'] = args.get('tools') if 'tools' not in pred_args else pred_args.get('tools', [])
@@ -159,70 +240,211 @@ class LangChainHandler(OpenAIHandler):
             memory=memory,
             agent=agent_name,
             max_iterations=pred_args.get('max_iterations', 3),
+            max_execution_time=pred_args.get('agent_timeout', None),
             verbose=pred_args.get('verbose', args.get('verbose', False)),
             handle_parsing_errors=True,
         )
 
-        # setup model description
+        return agent
+
+    def _get_model_kwargs(self, args, pred_args):
+        # api argument validation
+        model_name = pred_args.get('model_name', args.get('model_name', self.default_model))
+
+        model_kwargs = {
+            'model_name': model_name,
+            'temperature': min(1.0, max(0.0, pred_args.get('temperature', args.get('temperature', 0.0)))),
+            'max_tokens': pred_args.get('max_tokens', args.get('max_tokens', self.default_max_tokens)),
+            'top_p': pred_args.get('top_p', None),
+            'frequency_penalty': pred_args.get('frequency_penalty', None),
+            'presence_penalty': pred_args.get('presence_penalty', None),
+            'n': pred_args.get('n', None),
+            'best_of': pred_args.get('best_of', None),
+            'request_timeout': pred_args.get('request_timeout', None),
+            'logit_bias': pred_args.get('logit_bias', None),
+            'openai_api_key': self._get_openai_api_key(args, strict=True),
+            'serper_api_key': self._get_serper_api_key(args, strict=False),
+        }
+        return {k: v for k, v in model_kwargs.items() if v is not None}  # filter out None values
+
+    def _publish_description(self, agent, args, pred_args):
+        """ Sets up the information to be published when describing the model. """
         description = {
             'allowed_tools': [agent.agent.allowed_tools],   # packed as list to avoid additional rows
-            'agent_type': agent_name,
+            'agent_type': pred_args.get('agent_name', args.get('agent_name', self.default_agent_model)),
             'max_iterations': agent.max_iterations,
-            'memory_type': memory.__class__.__name__,
+            'memory_type': agent.memory.__class__.__name__,
         }
-        description = {**description, **model_kwargs}
+        description = {**description, **self._get_model_kwargs(args, pred_args)}
         description.pop('openai_api_key', None)
+        description.pop('serper_api_key', None)
         self.model_storage.json_set('description', description)
 
-        return agent
-
-    def run_agent(self, df, agent, args, pred_args):
+    def run_agent(self, df, agent, args, pred_args, agent_factory=None):
+        """
+        Prompts are dispatched to the agent from a pool of threads. As agents (and their memory) can't be shared
+        between threads, each worker uses its own agent built with `agent_factory`. Without a factory, or by default if
+        the agent has memory (so that each row sees the conversation of the previous ones), prompts run sequentially.
+        """
         # TODO abstract prompt templating into a common utility method, this is also used in vanilla OpenAI
         if pred_args.get('prompt_template', False):
             base_template = pred_args['prompt_template']  # override with predict-time template if available
         else:
             base_template = args['prompt_template']
 
-        input_variables = []
-        matches = list(re.finditer("{{(.*?)}}", base_template))
-
-        for m in matches:
-            input_variables.append(m[0].replace('{', '').replace('}', ''))
+        input_variables, formatter = _parse_template(base_template)
+        input_variables = list(input_variables)
 
-        empty_prompt_ids = np.where(df[input_variables].isna().all(axis=1).values)[0]
+        empty_mask = df[input_variables].isna().all(axis=1).to_numpy()
 
-        base_template = base_template.replace('{{', '{').replace('}}', '}')
-        prompts = []
+        # add empty quote if data is missing (any null, NaT included), prompts are lazily formatted as they get
+        # dispatched to the agent. note: no need to cast to str beforehand, the formatter already does it per value
+        inputs = df.loc[~empty_mask, input_variables]
+        records = inputs.astype(object).where(inputs.notna(), '').itertuples(index=False, name=None)
+        prompts = (formatter(record) for record in records)
 
-        for i, row in df.iterrows():
-            if i not in empty_prompt_ids:
-                prompt = PromptTemplate(input_variables=input_variables, template=base_template)
-                kwargs = {}
-                for col in input_variables:
-                    kwargs[col] = row[col] if row[col] is not None else ''  # add empty quote if data is missing
-                prompts.append(prompt.format(**kwargs))
+        if agent_factory is None:
+            max_concurrency = 1
+        else:
+            default_concurrency = 1 if agent.memory is not None else _DEFAULT_MAX_CONCURRENCY
+            max_concurrency = pred_args.get('max_concurrency', default_concurrency)
+            if not isinstance(max_concurrency, int) or max_concurrency < 1:
+                raise Exception(f'`max_concurrency` must be a positive integer, got: {max_concurrency}')
 
         def _completion(agent, prompts):
             # TODO: ensure that agent completion plus prompt match the maximum allowed by the user
-            # TODO: use async API if possible for parallelized completion
-            completions = []
-            for prompt in prompts:
+            # note: `agent.arun` is not used as the custom mindsdb tools are sync only, so we rely on threads instead
+            idle_agents = queue.SimpleQueue()  # each worker takes an idle agent, or builds a new one if there is none
+            idle_agents.put(agent)
+
+            def _acquire_agent():
                 try:
-                    completions.append(agent.run(prompt))
-                except Exception as e:
-                    completions.append(f'agent failed with error:\n{str(e)[:50]}...')
-            return [c for c in completions]
+                    return idle_agents.get_nowait()
+                except queue.Empty:
+                    return agent_factory()
 
-        completion = _completion(agent, prompts)
+            def _run(prompt):
+                worker_agent = None
+                try:
+                    worker_agent = _acquire_agent()
+                    return worker_agent.run(prompt)
+                except Exception as e:
+                    return _format_agent_error(e)
+                finally:
+                    if worker_agent is not None:
+                        idle_agents.put(worker_agent)
+                    if db.session is not None:
+                        db.session.remove()  # each pool thread gets its own scoped session from the mindsdb tools
+
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
+            try:
+                # at most `max_concurrency` prompts are formatted and in flight at any time, results are yielded in
+                # submission order, which matches the original prompt order
+                in_flight = collections.deque()
+                for prompt in prompts:
+                    if len(in_flight) >= max_concurrency:
+                        yield in_flight.popleft().result()
+                    # mindsdb's request context lives in context variables, which pool threads do not inherit
+                    in_flight.append(executor.submit(contextvars.copy_context().run, _run, prompt))
+                while in_flight:
+                    yield in_flight.popleft().result()
+            finally:
+                executor.shutdown()
+
+        if pred_args.get('semantic_cache', False):
+            completions = self._cached_completion(list(prompts), lambda ps: _completion(agent, ps), args, pred_args)
+        else:
+            completions = _completion(agent, prompts)
 
-        # add null completion for empty prompts
-        for i in sorted(empty_prompt_ids):
-            completion.insert(i, None)
+        out = np.empty(len(df), dtype=object)  # empty prompts keep a null completion
+        for i, completion in zip(np.flatnonzero(~empty_mask), completions):
+            out[i] = completion
 
-        pred_df = pd.DataFrame(completion, columns=[args['target']])
+        pred_df = pd.DataFrame({args['target']: out})
 
         return pred_df
 
+    def _cached_completion(self, prompts, completion_fn, args, pred_args):
+        """
+        Serves prompts from the semantic cache whenever an equal prompt (or, if `cache_threshold` is set, a similar
+        enough one) was answered before. Only cache misses are passed to `completion_fn`, and their (successful)
+        completions are added to the cache.
+
+        Similarity lookups are opt-in, as rendered prompts share the template boilerplate, which can make prompts that
+        only differ in their input (e.g. two different country names) look alike.
+
+        Relevant predict-time parameters:
+            - cache_threshold: min cosine similarity to reuse the completion of a similar prompt
+            - cache_ttl: seconds after which a cached completion expires
+            - cache_max_size: max amount of cached completions, the oldest ones are evicted first
+        """
+        # the cache is partitioned by the settings that affect completions, e.g. a different model never reuses them
+        settings = {key: pred_args.get(key, args.get(key)) for key in _CACHE_SETTINGS}
+        settings['write_privileges'] = self.write_privileges
+        fingerprint = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+        storage_key = f'semantic_cache_{fingerprint[:16]}'
+
+        threshold = pred_args.get('cache_threshold', None)
+        cache_kwargs = {
+            'ttl': pred_args.get('cache_ttl', None),
+            'max_size': pred_args.get('cache_max_size', _DEFAULT_CACHE_MAX_SIZE),
+        }
+        if threshold is not None:
+            cache_kwargs['threshold'] = threshold
+        cache = SemanticCache.from_dict(self.model_storage.json_get(storage_key), **cache_kwargs)
+
+        def _embed(indexes):
+            # batched, instead of one request per prompt. the cache is optional, so a failure here must not fail
+            # the whole predict call: prompts are then answered (and not cached) as if there was no cache
+            try:
+                embedder = OpenAIEmbeddings(openai_api_key=self._get_openai_api_key(args, strict=True))
+                return dict(zip(indexes, embedder.embed_documents([prompts[i] for i in indexes])))
+            except Exception as e:
+                log.logger.warning(f'LangChain semantic cache disabled for this call, embedding failed: {e}')
+                return None
+
+        completions = [cache.get(prompt) for prompt in prompts]
+        misses = [i for i, completion in enumerate(completions) if completion is None]
+
+        embeddings = {}  # prompt index -> embedding, or None if embedding failed (nothing is cached then)
+        if misses and threshold is not None:
+            embeddings = _embed(misses)
+            if embeddings is not None:
+                for i in misses:
+                    completions[i] = cache.search(embeddings[i])
+                misses = [i for i in misses if completions[i] is None]
+
+        if misses:
+            cacheable = []
+            for i, result in zip(misses, completion_fn([prompts[i] for i in misses])):
+                completions[i] = result
+                if isinstance(result, str) and not result.startswith(_AGENT_ERROR_PREFIX) \
+                        and result != _AGENT_STOPPED_OUTPUT:
+                    cacheable.append(i)
+
+            to_embed = [i for i in cacheable if i not in (embeddings or {})]
+            if embeddings is not None and to_embed:
+                embeddings.update(_embed(to_embed) or {})
+            cacheable = [i for i in cacheable if i in (embeddings or {})]
+            if cacheable:
+                # reloaded right before writing, so that entries stored by concurrent predict calls are kept
+                cache = SemanticCache.from_dict(self.model_storage.json_get(storage_key), **cache_kwargs)
+                cache.add_many(
+                    [prompts[i] for i in cacheable],
+                    [embeddings[i] for i in cacheable],
+                    [completions[i] for i in cacheable],
+                )
+                self.model_storage.json_set(storage_key, cache.to_dict())
+
+        return completions
+
+    def _get_metadata(self, key, fetch_fn):
+        """ Returns the result of `fetch_fn`, which is called only once per `key` within a predict call. """
+        with self._metadata_lock:  # the metadata tool is used by all of the concurrent agents
+            if key not in self._metadata_cache:
+                self._metadata_cache[key] = fetch_fn()
+            return self._metadata_cache[key]
+
     def _setup_tools(self, model_kwargs, pred_args, executor):
         def _mdb_exec_call(query: str) -> str:
             """ We define it like this to pass the executor through the closure, as custom classes don't allow custom field assignment. """  # noqa
@@ -230,12 +452,10 @@ class LangChainHandler(OpenAIHandler):
                 ast_query = parse_sql(query.strip('`'), dialect='mindsdb')
                 ret = executor.execute_command(ast_query)
 
-                data = ret.data  # list of lists
-                data = '\n'.join([  # rows
-                    '\t'.join(      # columns
-                        str(row) if isinstance(row, str) else [str(value) for value in row]
-                    ) for row in data
-                ])
+                data = '\n'.join(  # rows
+                    row if isinstance(row, str) else '\t'.join(map(str, row))  # columns
+                    for row in ret.data  # list of lists
+                )
             except Exception as e:
                 data = f"mindsdb tool failed with error:\n{str(e)}"   # let the agent know
             return data
@@ -249,12 +469,12 @@ class LangChainHandler(OpenAIHandler):
                 integrations = executor.session.integration_controller
                 handler = integrations.get_handler(integration)
 
+                df = self._get_metadata((integration,), lambda: handler.get_tables().data_frame)
+
                 if len(parts) == 1:
-                    df = handler.get_tables().data_frame
                     data = f'The integration `{integration}` has {df.shape[0]} tables: {", ".join(list(df["TABLE_NAME"].values))}'  # noqa
 
                 if len(parts) == 2:
-                    df = handler.get_tables().data_frame
                     table_name = parts[-1]
                     try:
                         table_name_col = 'TABLE_NAME' if 'TABLE_NAME' in df.columns else 'table_name'
@@ -267,8 +487,11 @@ class LangChainHandler(OpenAIHandler):
                             data = f'Metadata for table {table_name}:\n\tRow count: {nrows}\n'
                         else:
                             data = f'Metadata for table {table_name}:\n'
-                        fields = handler.get_columns(table_name).data_frame['Field'].to_list()
-                        types = handler.get_columns(table_name).data_frame['Type'].to_list()
+                        cols_df = self._get_metadata(
+                            (integration, table_name),
+                            lambda: handler.get_columns(table_name).data_frame
+                        )
+                        fields, types = cols_df['Field'].to_list(), cols_df['Type'].to_list()
                         data += f'List of columns and types:\n'
                         data += '\n'.join([f'\tColumn: `{field}`\tType: `{typ}`' for field, typ in zip(fields, types)])
                     except:
@@ -288,25 +511,25 @@ class LangChainHandler(OpenAIHandler):
                 return f"mindsdb write tool failed with error:\n{str(e)}"
 
         mdb_tool = Tool(
-                name="MindsDB",
-                func=_mdb_exec_call,
-                description="useful to read from databases or tables connected to the mindsdb machine learning package. the action must be a valid simple SQL query, always ending with a semicolon. For example, you can do `show databases;` to list the available data sources, and `show tables;` to list the available tables within each data source."  # noqa
-            )
+            name="MindsDB",
+            func=_mdb_exec_call,
+            description=_MDB_TOOL_DESCRIPTION
+        )
 
         mdb_meta_tool = Tool(
             name="MDB-Metadata",
             func=_mdb_exec_metadata_call,
-            description="useful to get column names from a mindsdb table or metadata from a mindsdb data source. the command should be either 1) a data source name, to list all available tables that it exposes, or 2) a string with the format `data_source_name.table_name` (for example, `files.my_table`), to get the table name, table type, column names, data types per column, and amount of rows of the specified table."  # noqa
+            description=_MDB_META_TOOL_DESCRIPTION
         )
 
         mdb_write_tool = Tool(
             name="MDB-Write",
             func=_mdb_write_call,
-            description="useful to write into data sources connected to mindsdb. command must be a valid SQL query with syntax: `INSERT INTO data_source_name.table_name (column_name_1, column_name_2, [...]) VALUES (column_1_value_row_1, column_2_value_row_1, [...]), (column_1_value_row_2, column_2_value_row_2, [...]), [...];`. note the command always ends with a semicolon. order of column names and values for each row must be a perfect match. If write fails, try casting value with a function, passing the value without quotes, or truncating string as needed.`."  # noqa
+            description=_MDB_WRITE_TOOL_DESCRIPTION
         )
 
         toolkit = pred_args['tools'] if pred_args['tools'] is not None else self.default_agent_tools
-        tools = load_tools(toolkit)
+        tools = _load_tools(toolkit)
         if model_kwargs.get('serper_api_key', False):
             search = GoogleSerperAPIWrapper(serper_api_key=model_kwargs.pop('serper_api_key'))
             tools.append(Tool(
@@ -345,6 +568,7 @@ class LangChainHandler(OpenAIHandler):
 
     def sql_agent_completion(self, df, args=None, pred_args=None):
         """This completion will be used to answer based on information passed by any MindsDB DB or API engine."""
+        pred_args = pred_args if pred_args else {}
         db = MindsDBSQL(engine=args['executor'], metadata=args['executor'].session.integration_controller)
         toolkit = SQLDatabaseToolkit(db=db)
         model_name = args.get('model_name', self.default_model)
@@ -352,6 +576,7 @@ class LangChainHandler(OpenAIHandler):
         agent = create_sql_agent(
             llm=llm,
             toolkit=toolkit,
+            max_execution_time=pred_args.get('agent_timeout', None),
             verbose=True
         )
         return agent
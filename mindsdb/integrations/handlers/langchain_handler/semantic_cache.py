@@ -0,0 +1,190 @@
+"""
+    Embedding-based cache for agent completions, used to avoid calling the LLM again for prompts that are equal or
+    semantically equivalent to previously answered ones.
+"""
+import time
+import base64
+from typing import Optional, List
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+_EPS = np.finfo(np.float32).eps
+
+
+def _quantize(embeddings: np.ndarray):
+    """
+    L2-normalizes each row (so that cosine similarity becomes a plain dot product), then quantizes it to int8 with a
+    per-row scale such that `row ~= quantized_row * scale`.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), _EPS)
+    scales = np.maximum(np.abs(embeddings).max(axis=-1), _EPS) / 127
+    quantized = np.round(embeddings / scales[..., None]).astype(np.int8)
+    return np.ascontiguousarray(quantized), scales.astype(np.float32)
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _similarity(embeddings, query):
+        n, d = embeddings.shape
+        scores = np.empty(n, dtype=np.int32)
+        for i in numba.prange(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(embeddings[i, j]) * np.int32(query[j])
+            scores[i] = acc
+        return scores
+else:
+    def _similarity(embeddings, query):
+        # int32 accumulation, einsum casts in buffered chunks instead of copying the whole int8 matrix
+        return np.einsum('ij,j->i', embeddings, query, dtype=np.int32)
+
+
+class SemanticCache:
+    """
+    Completions are looked up first by exact prompt match, and then by the cosine similarity between the embedding of
+    the prompt and the embeddings of all cached prompts. A cached completion is reused if the best match is at least
+    as similar as `threshold`.
+
+    Entries older than `ttl` seconds are dropped, and the oldest entries are evicted once `max_size` is exceeded.
+
+    Embeddings are normalized and quantized to int8 on insertion, which makes the cache 4x smaller than with float32
+    and each lookup a single integer matrix-vector product. If `numba` is installed, it is computed by a parallel
+    JIT-compiled kernel.
+    """
+    def __init__(self, threshold: float = 0.92, ttl: Optional[float] = None, max_size: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.prompts: List[str] = []
+        self.completions: List[str] = []
+        self.timestamps: List[float] = []
+        self.embeddings = None  # (N, d) contiguous int8 matrix, one quantized normalized row per cached prompt
+        self.scales = None      # (N,) float32 dequantization scale of each row
+        self._index = {}        # prompt -> row
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def get(self, prompt: str) -> Optional[str]:
+        """ Exact match lookup, does not require an embedding. Call `expire` beforehand to drop stale entries. """
+        idx = self._index.get(prompt)
+        return self.completions[idx] if idx is not None else None
+
+    def search(self, embedding) -> Optional[str]:
+        """ Returns the completion of the most similar cached prompt, if it is above the similarity threshold. """
+        if len(self) == 0:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if not query.any():
+            return None
+
+        query, query_scale = _quantize(query)
+        scores = _similarity(self.embeddings, query) * self.scales * query_scale
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return self.completions[best]
+        return None
+
+    def add(self, prompt: str, embedding, completion: str):
+        self.add_many([prompt], [embedding], [completion])
+
+    def add_many(self, prompts: List[str], embeddings, completions: List[str]):
+        """ Batched version of `add`, new rows are stacked into the cache in a single step. """
+        if len(prompts) == 0:
+            return
+
+        latest = {prompt: i for i, prompt in enumerate(prompts)}  # for repeated prompts, the last completion wins
+        keep = sorted(latest.values())
+        prompts = [prompts[i] for i in keep]
+        completions = [completions[i] for i in keep]
+        rows, scales = _quantize(np.asarray(embeddings, dtype=np.float32)[keep])
+
+        if any(prompt in self._index for prompt in prompts):
+            replaced = set(prompts)
+            self._drop(np.array([p in replaced for p in self.prompts]))
+
+        offset = len(self)
+        now = time.time()
+        self.prompts.extend(prompts)
+        self.completions.extend(completions)
+        self.timestamps.extend([now] * len(prompts))
+        if self.embeddings is None:
+            self.embeddings, self.scales = rows, scales
+        else:
+            self.embeddings = np.vstack([self.embeddings, rows])
+            self.scales = np.concatenate([self.scales, scales])
+        self._index.update({prompt: offset + i for i, prompt in enumerate(prompts)})
+
+        if len(self) > self.max_size:
+            # entries are kept in insertion order, so the oldest ones are at the front
+            mask = np.zeros(len(self), dtype=bool)
+            mask[:len(self) - self.max_size] = True
+            self._drop(mask)
+
+    def to_dict(self) -> dict:
+        return {
+            'prompts': self.prompts,
+            'completions': self.completions,
+            'timestamps': self.timestamps,
+            # stored as base64 encoded bytes, which is several times more compact than a JSON list of ints
+            'embeddings': base64.b64encode(self.embeddings.tobytes()).decode() if self.embeddings is not None else '',
+            'scales': self.scales.tolist() if self.scales is not None else [],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], **kwargs) -> 'SemanticCache':
+        cache = cls(**kwargs)
+        if not data or not data.get('prompts'):
+            return cache
+
+        cache.prompts = list(data['prompts'])
+        cache.completions = list(data['completions'])
+        cache.timestamps = list(data['timestamps'])
+        if isinstance(data['embeddings'], str):
+            embeddings = np.frombuffer(base64.b64decode(data['embeddings']), dtype=np.int8)
+            cache.embeddings = embeddings.reshape(len(cache.prompts), -1).copy()
+            cache.scales = np.asarray(data['scales'], dtype=np.float32)
+        elif data.get('scales'):
+            cache.embeddings = np.ascontiguousarray(data['embeddings'], dtype=np.int8)  # stored as a list of ints
+            cache.scales = np.asarray(data['scales'], dtype=np.float32)
+        else:
+            cache.embeddings, cache.scales = _quantize(data['embeddings'])  # stored before quantization was added
+        cache._reindex()
+
+        if len(cache) > cache.max_size:
+            mask = np.zeros(len(cache), dtype=bool)
+            mask[:len(cache) - cache.max_size] = True
+            cache._drop(mask)
+        cache.expire()
+        return cache
+
+    def expire(self):
+        """ Drops entries older than `ttl`. Done once per batch of lookups, rather than on every single one. """
+        if self.ttl is None or len(self) == 0:
+            return
+        expired = np.asarray(self.timestamps) < (time.time() - self.ttl)
+        if expired.any():
+            self._drop(expired)
+
+    def _drop(self, mask: np.ndarray):
+        """ Removes all entries flagged in the boolean `mask`. """
+        keep = np.flatnonzero(~mask)
+        self.prompts = [self.prompts[i] for i in keep]
+        self.completions = [self.completions[i] for i in keep]
+        self.timestamps = [self.timestamps[i] for i in keep]
+        if len(keep) > 0:
+            self.embeddings, self.scales = self.embeddings[keep], self.scales[keep]
+        else:
+            self.embeddings, self.scales = None, None
+        self._reindex()
+
+    def _reindex(self):
+        self._index = {prompt: i for i, prompt in enumerate(self.prompts)}
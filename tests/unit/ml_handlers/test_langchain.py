@@ -0,0 +1,359 @@
+import time
+import threading
+import concurrent.futures
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mindsdb.utilities.context import context as ctx
+from mindsdb.integrations.handlers.langchain_handler.langchain_handler import (
+    LangChainHandler, _compile_template, _load_tools, _load_stateless_tool, _parse_template
+)
+from mindsdb.integrations.handlers.langchain_handler.semantic_cache import SemanticCache
+
+
+class FakeAgent:
+    """ Mimics the `run` interface of a LangChain agent, recording where and how it was called. """
+    def __init__(self, memory=None, delay=0.1):
+        self.memory = memory
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def run(self, prompt):
+        assert self.lock.acquire(blocking=False), 'agent used by two threads at the same time'
+        try:
+            if 'fail' in prompt:
+                raise ValueError(prompt * 1000)
+            time.sleep(self.delay)
+            return f'{prompt}|{ctx.company_id}'
+        finally:
+            self.lock.release()
+
+
+class TestRunAgent:
+    def run_agent(self, df, pred_args, memory=None):
+        ctx.company_id = 7
+        handler = LangChainHandler(model_storage=MagicMock(), engine_storage=MagicMock())
+        agents = []
+
+        def agent_factory():
+            agents.append(FakeAgent(memory=memory))
+            return agents[-1]
+
+        args = {'prompt_template': 'q: {{question}}', 'target': 'answer'}
+        pred_df = handler.run_agent(df, agent_factory(), args, pred_args, agent_factory=agent_factory)
+        return pred_df, agents
+
+    def test_concurrent_completion(self):
+        df = pd.DataFrame({'question': ['a', None, 'b', 'fail', 'c']})
+        pred_df, agents = self.run_agent(df, {'max_concurrency': 4})
+
+        answers = pred_df['answer'].tolist()
+        assert answers[0] == 'q: a|7'  # request context is available inside worker threads
+        assert pd.isna(answers[1])
+        assert answers[2] == 'q: b|7'
+        assert answers[3].startswith('agent failed with error:\nq: fail')
+        assert len(answers[3]) < 100
+        assert answers[4] == 'q: c|7'
+        assert 1 < len(agents) <= 4
+
+    def test_agent_with_memory_runs_sequentially(self):
+        df = pd.DataFrame({'question': ['a', 'b', 'c']})
+        pred_df, agents = self.run_agent(df, {}, memory=object())
+
+        assert pred_df['answer'].tolist() == ['q: a|7', 'q: b|7', 'q: c|7']
+        assert len(agents) == 1
+
+    def test_template_parsed_once(self):
+        _parse_template.cache_clear()
+        df = pd.DataFrame({'question': ['a']})
+        self.run_agent(df, {})
+        self.run_agent(df, {})  # by another handler, as they are rebuilt for every predict call
+
+        assert _parse_template.cache_info().misses == 1
+        assert _parse_template.cache_info().hits == 1
+
+    @patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler.db')
+    def test_worker_sessions_are_removed(self, mock_db):
+        df = pd.DataFrame({'question': ['a', 'b', 'c']})
+        self.run_agent(df, {'max_concurrency': 2})
+
+        assert mock_db.session.remove.call_count == 3
+
+    @pytest.mark.parametrize('max_concurrency', [0, -1, 1.5])
+    def test_invalid_max_concurrency(self, max_concurrency):
+        df = pd.DataFrame({'question': ['a']})
+        with pytest.raises(Exception, match='max_concurrency'):
+            self.run_agent(df, {'max_concurrency': max_concurrency})
+
+    def test_description_published_once(self):
+        ctx.company_id = 7
+        handler = LangChainHandler(model_storage=MagicMock(), engine_storage=MagicMock())
+        handler.model_storage.json_get.return_value = {'prompt_template': 'q: {{question}}', 'target': 'answer'}
+        df = pd.DataFrame({'question': ['a', 'b', 'c', 'd']})
+
+        with patch.object(handler, 'default_completion', side_effect=lambda *_: FakeAgent()) as mock_completion, \
+                patch.object(handler, '_publish_description') as mock_publish:
+            pred_df = handler.predict(df, {'executor': MagicMock(), 'predict_params': {'max_concurrency': 4}})
+
+        assert pred_df['answer'].tolist() == ['q: a|7', 'q: b|7', 'q: c|7', 'q: d|7']
+        assert mock_completion.call_count > 1  # concurrent workers build their own agents
+        mock_publish.assert_called_once()
+
+
+def embed(texts):
+    # letter counts, which makes prompts that share most of their text similar
+    return [[text.count(c) for c in 'abcdefghijklmnopqrstuvwxyz'] for text in texts]
+
+
+@patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler.OpenAIEmbeddings')
+class TestCachedCompletion:
+    def setup_method(self):
+        self.storage = {}
+        model_storage = MagicMock()
+        model_storage.json_get.side_effect = self.storage.get
+        model_storage.json_set.side_effect = self.storage.__setitem__
+        self.handler = LangChainHandler(model_storage=model_storage, engine_storage=MagicMock())
+        self.handler._get_openai_api_key = MagicMock(return_value='key')
+        self.calls = []
+
+    def complete(self, prompts):
+        self.calls.append(list(prompts))
+        outputs = {
+            'fail': 'agent failed with error:\nrate limit...',
+            'stop': 'Agent stopped due to iteration limit or time limit.',
+        }
+        return [outputs.get(p, f'answer to {p}') for p in prompts]
+
+    def run(self, prompts, args=None, **pred_args):
+        return self.handler._cached_completion(prompts, self.complete, args or {}, pred_args)
+
+    def test_exact_match_by_default(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+
+        assert self.run(['capital of France']) == ['answer to capital of France']
+        assert self.run(['capital of France', 'capital of Germany']) == [
+            'answer to capital of France', 'answer to capital of Germany'
+        ]
+        assert self.calls == [['capital of France'], ['capital of Germany']]
+
+    def test_similar_prompts(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+
+        self.run(['capital of France'])
+        assert self.run(['capital of france'], cache_threshold=0.9) == ['answer to capital of France']
+        assert self.run(['population of Japan'], cache_threshold=0.9) == ['answer to population of Japan']
+        assert self.calls == [['capital of France'], ['population of Japan']]
+
+    def test_partitioned_by_settings(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+
+        self.run(['a'], args={'model_name': 'gpt-3.5-turbo'})
+        self.run(['a'], args={'model_name': 'gpt-3.5-turbo'}, temperature=0.5)
+        self.run(['a'], args={'model_name': 'gpt-3.5-turbo'}, model_name='gpt-4')
+        self.run(['a'], args={'model_name': 'gpt-3.5-turbo'})
+        assert self.calls == [['a'], ['a'], ['a']]
+        assert len(self.storage) == 3
+
+    def test_merge_on_write(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+
+        def complete(prompts):
+            self.run(['b'])  # a concurrent predict call stores its completions in the meantime
+            return self.complete(prompts)
+
+        self.handler._cached_completion(['a'], complete, {}, {})
+        assert self.run(['a', 'b']) == ['answer to a', 'answer to b']
+        assert self.calls == [['b'], ['a']]
+
+    def test_failures_are_not_cached(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+
+        self.run(['fail', 'stop', 'ok'])
+        self.run(['fail', 'stop', 'ok'])
+        assert self.calls == [['fail', 'stop', 'ok'], ['fail', 'stop']]
+
+    def test_embedding_failure(self, mock_embeddings):
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+        self.run(['a'])
+
+        mock_embeddings.return_value.embed_documents.side_effect = RuntimeError('quota exceeded')
+        assert self.run(['a', 'b'], cache_threshold=0.9) == ['answer to a', 'answer to b']
+        assert self.run(['a', 'b']) == ['answer to a', 'answer to b']
+        assert self.calls == [['a'], ['b'], ['b']]  # exact matches are still served, new completions aren't cached
+
+
+@patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler._load_tools', new=lambda toolkit: [])
+@patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler.Tool', new=dict)
+class TestMindsDBTools:
+    def setup_tools(self, executor):
+        handler = LangChainHandler(model_storage=MagicMock(), engine_storage=MagicMock())
+        return {tool['name']: tool['func'] for tool in handler._setup_tools({}, {'tools': []}, executor)}
+
+    def test_metadata_fetched_once(self):
+        executor = MagicMock()
+        integration = executor.session.integration_controller.get_handler.return_value
+        integration.get_tables.return_value.data_frame = pd.DataFrame({
+            'TABLE_NAME': ['t1', 't2'], 'ROW_COUNT': [10, 20], 'TABLE_TYPE': ['BASE TABLE', 'BASE TABLE']
+        })
+        integration.get_columns.return_value.data_frame = pd.DataFrame({'Field': ['a', 'b'], 'Type': ['int', 'text']})
+        metadata_tool = self.setup_tools(executor)['MDB-Metadata']
+
+        assert metadata_tool('files') == 'The integration `files` has 2 tables: t1, t2'
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(metadata_tool, ['files.t1', '`files`.`t1`'] * 4))
+        assert len(set(results)) == 1
+        assert 'Row count: 10' in results[0] and 'Column: `b`\tType: `text`' in results[0]
+
+        integration.get_tables.assert_called_once()
+        integration.get_columns.assert_called_once_with('t1')
+
+    @patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler.parse_sql')
+    def test_query_result_rows(self, mock_parse_sql):
+        executor = MagicMock()
+        executor.execute_command.return_value.data = [['a', 1, None], 'show tables\tresult', [2.5]]
+        mdb_tool = self.setup_tools(executor)['MindsDB']
+
+        assert mdb_tool('`select * from files.t1;`') == 'a\t1\tNone\nshow tables\tresult\n2.5'
+        mock_parse_sql.assert_called_once_with('select * from files.t1;', dialect='mindsdb')
+
+
+class TestSemanticCache:
+    def test_exact_and_similar_hits(self):
+        cache = SemanticCache(threshold=0.9)
+        cache.add('a', [1, 0, 0], 'A')
+        cache.add('b', [0, 1, 0], 'B')
+
+        assert cache.get('a') == 'A'
+        assert cache.get('c') is None
+        assert cache.search([0.95, 0.05, 0]) == 'A'
+        assert cache.search([0, 2, 0.1]) == 'B'
+
+    def test_threshold(self):
+        cache = SemanticCache(threshold=0.9)
+        cache.add('a', [1, 0, 0], 'A')
+
+        assert cache.search([1, 1, 0]) is None  # cosine similarity ~0.71
+        assert cache.search([0, 0, 0]) is None
+        cache.threshold = 0.7
+        assert cache.search([1, 1, 0]) == 'A'
+
+    def test_ttl(self):
+        cache = SemanticCache(ttl=60)
+        cache.add('a', [1, 0, 0], 'A')
+        cache.add('b', [0, 1, 0], 'B')
+        cache.timestamps[0] -= 120
+
+        assert cache.get('a') == 'A'  # lookups alone do not expire entries
+        cache.expire()
+        assert cache.get('a') is None
+        assert cache.search([1, 0, 0]) is None
+        assert cache.get('b') == 'B'
+
+        reloaded = SemanticCache.from_dict(cache.to_dict(), ttl=60)
+        reloaded.timestamps[0] -= 120
+        assert len(SemanticCache.from_dict(reloaded.to_dict(), ttl=60)) == 0  # expired on load
+
+    def test_max_size_eviction(self):
+        cache = SemanticCache(max_size=2)
+        cache.add('a', [1, 0, 0], 'A')
+        cache.add('b', [0, 1, 0], 'B')
+        cache.add('c', [0, 0, 1], 'C')
+
+        assert len(cache) == 2
+        assert cache.get('a') is None  # oldest entry is evicted first
+        assert cache.search([0, 0, 1]) == 'C'
+        assert cache.search([0, 1, 0]) == 'B'
+
+    def test_add_many_replaces(self):
+        cache = SemanticCache()
+        cache.add('a', [1, 0, 0], 'A')
+        cache.add_many(
+            ['b', 'a', 'b'],
+            [[0, 1, 0], [1, 0, 0], [0, 1, 0]],
+            ['B', 'A2', 'B2'],
+        )
+
+        assert len(cache) == 2
+        assert cache.get('a') == 'A2'
+        assert cache.get('b') == 'B2'  # repeated prompts keep their last completion
+        assert cache.search([1, 0.01, 0]) == 'A2'
+
+    def test_serialization(self):
+        cache = SemanticCache()
+        embeddings = np.random.default_rng(0).normal(size=(10, 64))
+        cache.add_many([str(i) for i in range(10)], embeddings, [f'c{i}' for i in range(10)])
+
+        reloaded = SemanticCache.from_dict(cache.to_dict())
+        assert reloaded.prompts == cache.prompts
+        assert np.array_equal(reloaded.embeddings, cache.embeddings)
+        assert reloaded.search(embeddings[3]) == 'c3'
+        assert len(SemanticCache.from_dict(None)) == 0
+
+    def test_legacy_float_cache(self):
+        legacy = {  # float embeddings, as stored before quantization
+            'prompts': ['a', 'b'],
+            'completions': ['A', 'B'],
+            'timestamps': [time.time(), time.time()],
+            'embeddings': [[2.0, 0.0, 0.0], [0.0, 0.5, 0.0]],
+        }
+        cache = SemanticCache.from_dict(legacy)
+
+        assert cache.embeddings.dtype == np.int8
+        assert cache.get('b') == 'B'
+        assert cache.search([1, 0, 0]) == 'A'
+        assert cache.search([0, 3, 0]) == 'B'
+
+
+class TestCompileTemplate:
+    @pytest.mark.parametrize('template', [
+        'plain text',
+        '{a}',
+        'a={a}, b={b}, again={a}',
+        '{{escaped}} {a} it\'s "quoted" \\ {b}\n',
+        '',
+    ])
+    def test_matches_format_map(self, template):
+        variables = ['a', 'b']
+        formatter = _compile_template(template, variables)
+        for row in [('x', 'y'), (1, 2.5), ('{b}', "'''")]:
+            assert formatter(row) == template.format_map(dict(zip(variables, row)))
+
+    def test_fallback(self):
+        # format specs, conversions and unknown fields are left to str.format
+        formatter = _compile_template('{a:>5}|{b!r}', ['a', 'b'])
+        assert formatter(('x', 'y')) == "    x|'y'"
+
+        formatter = _compile_template('{a} {c}', ['a', 'b'])
+        with pytest.raises(KeyError):
+            formatter(('x', 'y'))
+
+    def test_malformed_template(self):
+        formatter = _compile_template('{a} {', ['a'])
+        with pytest.raises(ValueError):
+            formatter(('x',))
+
+
+class TestLoadTools:
+    @staticmethod
+    def fake_load_tools(names):
+        # like langchain, `requests_all` is expanded into one tool per http method
+        if 'requests_all' in names:
+            names = [name for name in names if name != 'requests_all'] + ['requests_get', 'requests_post']
+        return [f'{name} tool' for name in names]
+
+    @patch('mindsdb.integrations.handlers.langchain_handler.langchain_handler.load_tools')
+    def test_expanded_tool_names(self, mock_load_tools):
+        mock_load_tools.side_effect = self.fake_load_tools
+        _load_stateless_tool.cache_clear()
+
+        tools = _load_tools(['requests_all', 'python_repl', 'wikipedia'])
+        assert sorted(tools) == ['python_repl tool', 'requests_get tool', 'requests_post tool', 'wikipedia tool']
+
+        # stateless tools are loaded only once, the others on every call
+        assert _load_tools(['wikipedia', 'python_repl']) == ['python_repl tool', 'wikipedia tool']
+        calls = [c.args[0] for c in mock_load_tools.call_args_list]
+        assert calls.count(['wikipedia']) == 1
+        assert calls.count(['python_repl']) == 1